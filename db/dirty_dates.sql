@@ -0,0 +1,7 @@
+CREATE TABLE dirty_dates
+(
+    timeframe                           VARCHAR(16),
+    datadate                            TIMESTAMP,
+
+    PRIMARY KEY (timeframe, datadate)
+);
\ No newline at end of file
@@ -0,0 +1,36 @@
+-- Converts the weekly_base and monthly_base heaps into tables range
+-- partitioned by datadate, with one partition per year, see
+-- db/weekly_base.sql and db/monthly_base.sql.
+BEGIN;
+
+DO $$
+DECLARE
+    base TEXT;
+    year INTEGER;
+BEGIN
+    FOREACH base IN ARRAY ARRAY['weekly_base', 'monthly_base'] LOOP
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', base, base || '_heap');
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', base || '_pkey', base || '_heap_pkey');
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS, PRIMARY KEY (gvkey, datadate)) '
+            'PARTITION BY RANGE (datadate)',
+            base, base || '_heap'
+        );
+        FOR year IN
+            EXECUTE format(
+                'SELECT DISTINCT EXTRACT(YEAR FROM datadate)::INTEGER FROM %I',
+                base || '_heap'
+            )
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                base || '_' || year, base, make_date(year, 1, 1), make_date(year + 1, 1, 1)
+            );
+        END LOOP;
+        EXECUTE format('INSERT INTO %I SELECT * FROM %I', base, base || '_heap');
+        EXECUTE format('DROP TABLE %I', base || '_heap');
+    END LOOP;
+END
+$$;
+
+COMMIT;
@@ -0,0 +1,23 @@
+-- Adds the mean count columns of the base tables, see aggregation_spec.
+-- Quarterly and annual rollups only weight means exactly once the weekly and
+-- monthly bases are rebuilt, e.g. with --backfill.
+BEGIN;
+
+DO $$
+DECLARE
+    base TEXT;
+    field TEXT;
+BEGIN
+    FOREACH base IN ARRAY ARRAY['weekly_base', 'monthly_base', 'quarterly_base', 'annual_base'] LOOP
+        FOREACH field IN ARRAY ARRAY[
+            'utilization_pct', 'bar', 'age', 'tickets', 'units', 'market_value_usd',
+            'loan_rate_avg', 'loan_rate_max', 'loan_rate_min', 'loan_rate_range',
+            'market_cap', 'shares_out', 'volume'
+        ] LOOP
+            EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS %I INTEGER', base, field || '_n');
+        END LOOP;
+    END LOOP;
+END
+$$;
+
+COMMIT;
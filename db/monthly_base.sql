@@ -23,5 +23,19 @@ CREATE TABLE monthly_base
 
     dps                                 INTEGER,
 
+    utilization_pct_n                   INTEGER,
+    bar_n                               INTEGER,
+    age_n                               INTEGER,
+    tickets_n                           INTEGER,
+    units_n                             INTEGER,
+    market_value_usd_n                  INTEGER,
+    loan_rate_avg_n                     INTEGER,
+    loan_rate_max_n                     INTEGER,
+    loan_rate_min_n                     INTEGER,
+    loan_rate_range_n                   INTEGER,
+    market_cap_n                        INTEGER,
+    shares_out_n                        INTEGER,
+    volume_n                            INTEGER,
+
     PRIMARY KEY (gvkey, datadate)
-);
\ No newline at end of file
+) PARTITION BY RANGE (datadate);
\ No newline at end of file
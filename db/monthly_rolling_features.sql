@@ -0,0 +1,19 @@
+CREATE TABLE monthly_rolling_features
+(
+    datadate                            TIMESTAMP,
+    gvkey                               INTEGER,
+
+    rtn_mean_4                          DECIMAL(25,15),
+    rtn_stdev_4                         DECIMAL(25,15),
+    utilization_pct_mean_4              DECIMAL(14,8),
+
+    rtn_mean_12                         DECIMAL(25,15),
+    rtn_stdev_12                        DECIMAL(25,15),
+    utilization_pct_mean_12             DECIMAL(14,8),
+
+    rtn_mean_52                         DECIMAL(25,15),
+    rtn_stdev_52                        DECIMAL(25,15),
+    utilization_pct_mean_52             DECIMAL(14,8),
+
+    PRIMARY KEY (gvkey, datadate)
+);
\ No newline at end of file
@@ -0,0 +1,41 @@
+CREATE TABLE quarterly_base
+(
+    datadate                            TIMESTAMP,
+    gvkey                               INTEGER,
+
+    utilization_pct                     DECIMAL(14,8),
+    bar                                 DECIMAL(14,8),
+    age                                 DECIMAL(18,7),
+    tickets                             DECIMAL(18,2),
+    units                               DECIMAL(18,4),
+    market_value_usd                    DECIMAL(18,2),
+    loan_rate_avg                       DECIMAL(18,9),
+    loan_rate_max                       DECIMAL(18,9),
+    loan_rate_min                       DECIMAL(18,9),
+    loan_rate_range                     DECIMAL(18,9),
+    loan_rate_stdev                     DECIMAL(18,9),
+
+    market_cap                          DECIMAL(30,15),
+    shares_out                          DECIMAL(30,4),
+    volume                              DECIMAL(30,15),
+    rtn                                 DECIMAL(25,15),
+    winsorized_5_rtn                    DECIMAL(25,15),
+
+    dps                                 INTEGER,
+
+    utilization_pct_n                   INTEGER,
+    bar_n                               INTEGER,
+    age_n                               INTEGER,
+    tickets_n                           INTEGER,
+    units_n                             INTEGER,
+    market_value_usd_n                  INTEGER,
+    loan_rate_avg_n                     INTEGER,
+    loan_rate_max_n                     INTEGER,
+    loan_rate_min_n                     INTEGER,
+    loan_rate_range_n                   INTEGER,
+    market_cap_n                        INTEGER,
+    shares_out_n                        INTEGER,
+    volume_n                            INTEGER,
+
+    PRIMARY KEY (gvkey, datadate)
+) PARTITION BY RANGE (datadate);
\ No newline at end of file
@@ -1,17 +1,35 @@
-"""Aggregates loader."""
+"""Aggregates loader.
 
+Aggregation and cleanup record the (timeframe, datadate) cross-sections they
+change in dirty_dates, and winsorization only recomputes those.
+
+Sharded runs (`--shard i/N`) only aggregate the gvkeys with `gvkey % N = i`,
+so several loaders can split the work. Winsorization is cross-sectional and
+needs every gvkey of a date, so once all shards are done a single unsharded
+loader runs the `finalize` stage.
+"""
+
+import argparse
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import logging
+import multiprocessing
 from sys import stdout
 import os
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import aggregates_loader.date_helpers as date_helpers
 import aggregates_loader.model as model
+from aggregates_loader.governor import MemoryGovernor
 from aggregates_loader.model.entity import Entity
 from aggregates_loader.persistence import source, target
+from aggregates_loader.profiling import Profiler
 import aggregates_loader.queries as queries
+from aggregates_loader.rolling_window import RollingWindow
+from aggregates_loader.shard import Shard
 from aggregates_loader.timeframe import TimeFrame
+import aggregates_loader.winsorize as winsorize
 
 logging.basicConfig(
     level=os.environ.get("LOG_LEVEL", "INFO").upper(),
@@ -45,62 +63,113 @@ class Loader:
 
     _entities = {
         "aggregate_base": Entity.aggregate_base,
+        "rolling_features": Entity.rolling_features,
     }
 
     _timeframes = {
         "weekly": TimeFrame.weekly,
         "monthly": TimeFrame.monthly,
+        "quarterly": TimeFrame.quarterly,
+        "annual": TimeFrame.annual,
     }
 
     _dates_generators = {
         TimeFrame.weekly: date_helpers.generate_weeks,
         TimeFrame.monthly: date_helpers.generate_months,
+        TimeFrame.quarterly: date_helpers.generate_quarters,
+        TimeFrame.annual: date_helpers.generate_years,
     }
 
     _get_timeframe_end = {
         TimeFrame.weekly: date_helpers.get_week_end,
         TimeFrame.monthly: date_helpers.get_month_end,
+        TimeFrame.quarterly: date_helpers.get_quarter_end,
+        TimeFrame.annual: date_helpers.get_year_end,
+    }
+
+    # Coarser timeframes are rolled up from the already persisted monthly
+    # aggregates instead of rescanning daily records.
+    _source_timeframes = {
+        TimeFrame.weekly: "daily",
+        TimeFrame.monthly: "daily",
+        TimeFrame.quarterly: "monthly",
+        TimeFrame.annual: "monthly",
     }
 
     _model_type = {
         Entity.aggregate_base: model.AggregateBase,
+        Entity.rolling_features: model.RollingFeatures,
     }
 
     _queries = {
         Entity.aggregate_base: queries.AggregateBaseQueries,
+        Entity.rolling_features: queries.RollingFeaturesQueries,
     }
 
-    def __init__(self) -> None:
-        self.source = source.Source(os.environ.get("SOURCE"))
+    _rolling_timeframes = [TimeFrame.weekly, TimeFrame.monthly]
+
+    ROLLING_BATCH_SIZE = 100000
+
+    STAGING_PAGE_SIZE = 10000
+
+    def __init__(
+        self,
+        shard: Optional[Shard] = None,
+        profiler: Optional[Profiler] = None,
+        governor: Optional[MemoryGovernor] = None,
+    ) -> None:
+        self._source_connection_string = os.environ.get("SOURCE")
+        self.source = source.Source(self._source_connection_string)
         self.target = target.Target(os.environ.get("TARGET"))
+        self.shard = shard
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.governor = governor if governor is not None else MemoryGovernor()
+
+    def run(self, backfill: bool = False) -> None:
+        """Persists records to the cap_iq_returns table.
 
-    def run(self) -> None:
-        """Persists records to the cap_iq_returns table."""
+        Args:
+            backfill: rebuild every year through partition swaps instead of
+                upserting from the last persisted date.
+        """
         entity = self._entities["aggregate_base"]
+        if backfill:
+            self._check_unsharded("backfill")
+        self.create_partitions(required=backfill)
         for timeframe in self._timeframes.values():
             logger.info(f"Starting process for {timeframe}_base...")
 
             time_intervals = self._dates_generators[timeframe](self.YEARS)
+            if backfill:
+                self.backfill(entity, timeframe, time_intervals)
+                continue
 
             periods_per_year = 1
             if timeframe == "monthly":
                 periods_per_year = 12
             if timeframe == "weekly":
                 periods_per_year = 52
+            if timeframe == "quarterly":
+                periods_per_year = 4
 
-            date_ranges = []
-            for intervals_slice in self.list_slicer(time_intervals, periods_per_year):
-                date_ranges.append((intervals_slice[0][0], intervals_slice[-1][-1]))
+            intervals_slices = self.list_slicer(time_intervals, periods_per_year)
 
-            last_persisted_date = self.target.get_last_persisted_date(timeframe)
+            last_persisted_date = self.target.get_last_persisted_date(
+                timeframe.value, shard=self.shard
+            )
             # daily_base max date is 2023-03-16
             if last_persisted_date:
-                date_ranges = [
-                    dr
-                    for dr in date_ranges
-                    if dr[1] >= last_persisted_date and dr[0] < datetime(2023, 3, 16)
+                intervals_slices = [
+                    intervals_slice
+                    for intervals_slice in intervals_slices
+                    if intervals_slice[-1][-1] >= last_persisted_date
+                    and intervals_slice[0][0] < datetime(2023, 3, 16)
                 ]
 
+            date_ranges = []
+            for intervals_slice in intervals_slices:
+                date_ranges.extend(self._governed_date_ranges(timeframe, intervals_slice))
+
             if not date_ranges:
                 logger.info(f"All records for {timeframe}_base have been persisted.")
                 continue
@@ -111,118 +180,540 @@ class Loader:
                 logger.info(f"Persisted {i}/{n} {timeframe}.")
                 logger.debug("Fetching records...")
 
-                raw_records = self.source.get_records(timeframe="daily", date_range=date_range)
+                with self.profiler.stage("fetch"):
+                    raw_records = self.source.get_records(
+                        timeframe=self._source_timeframes[timeframe],
+                        date_range=date_range,
+                        shard=self.shard,
+                    )
+                self.governor.observe("records", raw_records)
 
                 if raw_records:
-                    logger.debug("Building history per gvkey...")
-                    history: Dict[int, List] = {}
-                    for record in raw_records:
-                        if record[1] not in history.keys():
-                            history[record[1]] = [record]
-                        else:
-                            history[record[1]].append(record)
-
-                    logger.debug("Curating records...")
-                    records = []
-                    for gvkey in history.keys():
-                        key_records = history[gvkey]
-
-                        binned_records = {}
-                        for record in key_records:
-                            period_end = self._get_timeframe_end[timeframe](record[0])
-                            if period_end in binned_records.keys():
-                                binned_records[period_end].append(record)
-                            else:
-                                binned_records[period_end] = [record]
-
-                        for d, rb in binned_records.items():
-                            if rb:
-                                curated_record = self._model_type[entity].build_record(
-                                    (d, gvkey), rb
-                                )
-                                if not curated_record.is_empty:
-                                    records.append(curated_record.as_tuple())
+                    with self.profiler.stage("curate"):
+                        columns = self.source.get_column_names(
+                            self._source_timeframes[timeframe]
+                        )
+                        records = self.curate_records(
+                            entity, timeframe, raw_records, columns
+                        )
 
                     logger.debug("Persisting records...")
-                    upsert_query = self._queries[entity].UPSERT.format(
-                        timeframe=timeframe.value
-                    )
-                    self.target.execute(upsert_query, records)
+                    with self.profiler.stage("persist"):
+                        upsert_query = self._queries[entity].UPSERT.format(
+                            timeframe=timeframe.value
+                        )
+                        self.target.execute(upsert_query, records)
+
+                        # Periods before the last persisted one are rebuilt
+                        # unchanged, the last one may have been partial.
+                        self._mark_dirty(
+                            timeframe.value,
+                            (
+                                r[0]
+                                for r in records
+                                if not last_persisted_date or r[0] >= last_persisted_date
+                            ),
+                        )
+                        if self._source_timeframes[timeframe] == "daily":
+                            self._mark_dirty(
+                                "daily",
+                                (
+                                    d
+                                    for d in {r[0] for r in raw_records}
+                                    if not last_persisted_date
+                                    or self._get_timeframe_end[timeframe](d)
+                                    >= last_persisted_date
+                                ),
+                            )
 
-                    self.target.commit_transaction()
+                        self.target.commit_transaction()
 
+                self.profiler.dump(
+                    f"run_{timeframe.value}_{date_range[0]:%Y%m%d}_{date_range[1]:%Y%m%d}"
+                )
                 i += 1
 
+    def create_partitions(self, required: bool = False) -> None:
+        """Creates the yearly partitions of every base table.
+
+        Tables that were not migrated to partitions (db/migrations) are
+        skipped, unless partitions are required.
+
+        Args:
+            required: raise if a base table is not partitioned.
+        """
+        for timeframe in self._timeframes.values():
+            if not self.target.is_partitioned(timeframe.value):
+                if required:
+                    raise RuntimeError(
+                        f"{timeframe.value}_base is not partitioned, apply db/migrations first."
+                    )
+                logger.warning(
+                    f"{timeframe.value}_base is not partitioned, see db/migrations."
+                )
+                continue
+            for year in self.YEARS:
+                self.target.create_partition(timeframe.value, year)
+        self.target.commit_transaction()
+
+    def backfill(
+        self, entity: Entity, timeframe: TimeFrame, time_intervals: List[Tuple]
+    ) -> None:
+        """Rebuilds the yearly partitions of a base table.
+
+        Each year is bulk loaded into an unindexed staging table, which is
+        then indexed and swapped in place of the year partition.
+
+        Args:
+            entity: entity to build.
+            timeframe: timeframe of the base table.
+            time_intervals: periods of the timeframe.
+        """
+        intervals_per_year: Dict[int, List[Tuple]] = {}
+        for interval in time_intervals:
+            intervals_per_year.setdefault(interval[1].year, []).append(interval)
+
+        n = len(intervals_per_year)
+        i = 0
+        for year, intervals in intervals_per_year.items():
+            logger.info(f"Backfilled {i}/{n} years of {timeframe.value}_base.")
+            self.target.create_staging(timeframe.value, year)
+            insert_query = self._queries[entity].INSERT_STAGING.format(
+                timeframe=timeframe.value, year=year
+            )
+
+            for date_range in self._governed_date_ranges(timeframe, intervals):
+                with self.profiler.stage("fetch"):
+                    raw_records = self.source.get_records(
+                        timeframe=self._source_timeframes[timeframe], date_range=date_range
+                    )
+                self.governor.observe("records", raw_records)
+
+                if raw_records:
+                    with self.profiler.stage("curate"):
+                        columns = self.source.get_column_names(
+                            self._source_timeframes[timeframe]
+                        )
+                        records = self.curate_records(
+                            entity, timeframe, raw_records, columns
+                        )
+
+                    with self.profiler.stage("persist"):
+                        self.target.execute(
+                            insert_query, records, page_size=self.STAGING_PAGE_SIZE
+                        )
+                        self._mark_dirty(timeframe.value, (r[0] for r in records))
+                        if self._source_timeframes[timeframe] == "daily":
+                            self._mark_dirty("daily", (r[0] for r in raw_records))
+
+            with self.profiler.stage("persist"):
+                self.target.swap_partition(timeframe.value, year)
+                self.target.commit_transaction()
+
+            self.profiler.dump(f"backfill_{timeframe.value}_{year}")
+            i += 1
+
+    def _governed_date_ranges(
+        self, timeframe: TimeFrame, intervals: List[Tuple]
+    ) -> List[Tuple[datetime, datetime]]:
+        """Splits consecutive periods into date ranges fitting the memory budget.
+
+        Args:
+            timeframe: timeframe of the periods.
+            intervals: consecutive (start, end) periods.
+
+        Returns:
+            Date ranges covering the periods.
+        """
+        source_timeframe = self._source_timeframes[timeframe]
+        chunks = self.governor.split(
+            intervals,
+            lambda chunk: self.source.count_records(
+                source_timeframe, self._date_range(timeframe, chunk), shard=self.shard
+            ),
+            "records",
+        )
+        return [self._date_range(timeframe, chunk) for chunk in chunks]
+
+    def _date_range(
+        self, timeframe: TimeFrame, intervals: List[Tuple]
+    ) -> Tuple[datetime, datetime]:
+        """Date range of the source records binned into consecutive periods.
+
+        Ranges of consecutive chunks of periods are contiguous, so no source
+        record falls between them, e.g. the last days of a year binned into
+        the first week of the next one.
+
+        Args:
+            timeframe: timeframe of the periods.
+            intervals: consecutive (start, end) periods.
+
+        Returns:
+            First and last day of the source records.
+        """
+        get_period_end = self._get_timeframe_end[timeframe]
+        return (
+            date_helpers.get_period_bounds(get_period_end, intervals[0][1])[0],
+            date_helpers.get_period_bounds(get_period_end, intervals[-1][1])[1],
+        )
+
+    def curate_records(
+        self,
+        entity: Entity,
+        timeframe: TimeFrame,
+        raw_records: List[Tuple],
+        columns: Tuple[str, ...],
+    ) -> List[Tuple]:
+        """Bins source records per gvkey and period and aggregates each bin.
+
+        Args:
+            entity: entity to build.
+            timeframe: timeframe of the bins.
+            raw_records: records from the source timeframe.
+            columns: column names of the raw records.
+
+        Returns:
+            Curated records as tuples.
+        """
+        if self._source_timeframes[timeframe] == "daily":
+            build_record = self._model_type[entity].build_record
+        else:
+            build_record = self._model_type[entity].build_rollup
+
+        logger.debug("Building history per gvkey...")
+        history: Dict[int, List] = {}
+        for record in raw_records:
+            if record[1] not in history.keys():
+                history[record[1]] = [record]
+            else:
+                history[record[1]].append(record)
+
+        logger.debug("Curating records...")
+        records = []
+        for gvkey in history.keys():
+            key_records = history[gvkey]
+
+            binned_records = {}
+            for record in key_records:
+                period_end = self._get_timeframe_end[timeframe](record[0])
+                if period_end in binned_records.keys():
+                    binned_records[period_end].append(record)
+                else:
+                    binned_records[period_end] = [record]
+
+            for d, rb in binned_records.items():
+                if rb:
+                    curated_record = build_record((d, gvkey), rb, columns)
+                    if not curated_record.is_empty:
+                        records.append(curated_record.as_tuple())
+
+        return records
+
+    def compute_rolling_features(self, full: bool = False) -> None:
+        """Persists rolling window features of the weekly and monthly bases.
+
+        Runs resume from the last persisted period, which is recomputed in
+        case it was partial. Base records rewritten before it, e.g. by a
+        backfill, are only picked up by a full run, cleanup refreshes the
+        gvkeys it cleans itself.
+
+        Args:
+            full: recompute every period instead of resuming.
+        """
+        entity = self._entities["rolling_features"]
+        for timeframe in self._rolling_timeframes:
+            logger.info(f"Starting process for {timeframe.value}_{entity.value}...")
+            first_date = None
+            if not full:
+                first_date = self.target.get_last_persisted_date(
+                    timeframe.value, table=entity.value, shard=self.shard
+                )
+            self._compute_rolling_features(timeframe, first_date)
+
+    def _compute_rolling_features(
+        self,
+        timeframe: TimeFrame,
+        first_date: Optional[datetime] = None,
+        gvkeys: Optional[List[int]] = None,
+    ) -> None:
+        """Recomputes the rolling features of a timeframe from a date on.
+
+        Records are streamed per gvkey and fed to sliding window accumulators,
+        after seeding the windows with the periods preceding the first
+        recomputed one. Features from that date on are deleted in the first
+        batch, so features of deleted base records do not remain.
+
+        Args:
+            timeframe: timeframe of the base table.
+            first_date: first date to recompute, None for every date.
+            gvkeys: only recompute these gvkeys, None for every gvkey.
+        """
+        entity = self._entities["rolling_features"]
+        model_type = self._model_type[entity]
+        max_window = max(model_type.WINDOWS)
+        upsert_query = self._queries[entity].UPSERT.format(timeframe=timeframe.value)
+
+        time_intervals = self._dates_generators[timeframe](self.YEARS)
+        period_ends = [interval[1] for interval in time_intervals]
+
+        first_period = 0
+        if first_date:
+            first_period = bisect_left(period_ends, first_date)
+        seed_period = max(first_period - max_window + 1, 0)
+        date_range = (time_intervals[seed_period][0], period_ends[-1])
+
+        self.target.delete_rolling_features(
+            timeframe.value,
+            first_date or time_intervals[0][0],
+            shard=self.shard,
+            gvkeys=gvkeys,
+        )
+
+        windows = [
+            (RollingWindow(size), RollingWindow(size))
+            for size in model_type.WINDOWS
+        ]
+        current_gvkey = None
+        records = []
+        for datadate, gvkey, utilization_pct, rtn in self.source.stream_records(
+            timeframe=timeframe.value,
+            date_range=date_range,
+            shard=self.shard,
+            gvkeys=gvkeys,
+        ):
+            if gvkey != current_gvkey:
+                for rtn_window, utilization_window in windows:
+                    rtn_window.reset()
+                    utilization_window.reset()
+                current_gvkey = gvkey
+
+            period = bisect_left(period_ends, datadate)
+            for rtn_window, utilization_window in windows:
+                rtn_window.push(period, rtn)
+                utilization_window.push(period, utilization_pct)
+
+            if period < first_period:
+                continue
+
+            features = [
+                (
+                    rtn_window.size,
+                    rtn_window.mean,
+                    rtn_window.stdev,
+                    utilization_window.mean,
+                )
+                for rtn_window, utilization_window in windows
+            ]
+            record = model_type.build_record((datadate, gvkey), features)
+            if not record.is_empty:
+                records.append(record.as_tuple())
+
+            if len(records) >= self.ROLLING_BATCH_SIZE:
+                self.target.execute(upsert_query, records)
+                self.target.commit_transaction()
+                records = []
+
+        if records:
+            self.target.execute(upsert_query, records)
+        self.target.commit_transaction()
+
     def cleanup(self):
         """Removes records for companies that are not
-        traded a minimum of days (trading days - 4) in that given month."""
+        traded a minimum of days (trading days - 4) in that given month.
+
+        Quarterly and annual records are rolled up from the monthly ones, so
+        the periods containing a cleaned month are rebuilt for its gvkeys.
+        Rolling features of the cleaned gvkeys are recomputed from the first
+        cleaned month on.
+        """
+        self._check_unsharded("cleanup")
         logger.info("Starting table cleanups...")
         timeframes = ["monthly", "weekly", "daily"]
         months = date_helpers.generate_months(self.YEARS)
         i = 0
         n = len(months)
+        cleaned_gvkeys = set()
+        first_cleaned_date = None
         for month in months:
             logger.debug(f"Cleaned {i}/{n} months...")
-            max_dps = self.target.get_max_dps(month)
+            with self.profiler.stage("fetch"):
+                max_dps = self.target.get_max_dps(month)
             if max_dps:
-                non_traded_gvkeys = self.target.get_non_traded_gvkeys(max_dps-4, month[0], month[1])
+                with self.profiler.stage("fetch"):
+                    non_traded_gvkeys = self.target.get_non_traded_gvkeys(max_dps-4, month[0], month[1])
                 if non_traded_gvkeys:
-                    delete_query = ("DELETE FROM {timeframe}_base "
-                                    "WHERE (gvkey) IN (VALUES %s) "
-                                    "AND datadate BETWEEN {month_start} AND {month_end};")
-                    for timeframe in timeframes:
-                        query = delete_query.format(timeframe=timeframe, month_start=f"\'{month[0]}\'", month_end=f"\'{month[1]}\'")
-                        self.target.execute(query, non_traded_gvkeys)
-                        self.target.commit_transaction()
+                    gvkeys = [r[0] for r in non_traded_gvkeys]
+                    with self.profiler.stage("delete"):
+                        for timeframe in timeframes:
+                            deleted_dates = self.target.delete_gvkeys(timeframe, gvkeys, month)
+                            self._mark_dirty(timeframe, deleted_dates)
+                            self.target.commit_transaction()
+                    self._rebuild_rollups(gvkeys, month)
+                    cleaned_gvkeys.update(gvkeys)
+                    if first_cleaned_date is None:
+                        first_cleaned_date = month[0]
                 i += 1
+            self.profiler.dump(f"cleanup_{month[0]:%Y%m%d}_{month[1]:%Y%m%d}")
         logger.debug(f"Cleaned {n}/{n} months...")
+        if cleaned_gvkeys:
+            logger.info("Refreshing rolling features of cleaned gvkeys...")
+            for timeframe in self._rolling_timeframes:
+                self._compute_rolling_features(
+                    timeframe, first_cleaned_date, sorted(cleaned_gvkeys)
+                )
         logger.info("Terminating...")
 
-    def winsorize_returns(self):
-        logger.info('Winsorizing returns...')
-        timeframes = ["monthly", "weekly", "daily"]
-        date_intervals = date_helpers.generate_intervals(self.YEARS)
-        n = len(date_intervals)
-        for timeframe in timeframes:
-            logger.info(f"Processing {timeframe} records...")
-            i = 0
-            for date_interval in date_intervals:
-                logger.debug(f"Processed {i}/{n} date intervals.")
-                raw_records = self.source.get_records(timeframe=timeframe, date_range=date_interval)
-                raw_records = [model.BaseData.build_record(r) for r in raw_records]
+    def _rebuild_rollups(self, gvkeys: List[int], month: Tuple) -> None:
+        """Rebuilds the rolled up records of gvkeys over the periods of a month.
 
-                if raw_records:
-                    logger.debug("Building history per date...")
-                    history: Dict[datetime, List[model.BaseData]] = {}
-                    for record in raw_records:
-                        if record.datadate not in history.keys():
-                            history[record.datadate] = [record]
+        Args:
+            gvkeys: gvkeys whose monthly records changed.
+            month: (start, end) of the month.
+        """
+        entity = self._entities["aggregate_base"]
+        for timeframe in self._timeframes.values():
+            if self._source_timeframes[timeframe] != "monthly":
+                continue
+            get_period_end = self._get_timeframe_end[timeframe]
+            period = date_helpers.get_period_bounds(get_period_end, get_period_end(month[1]))
+
+            with self.profiler.stage("fetch"):
+                raw_records = self.source.get_gvkey_records("monthly", gvkeys, period)
+
+            records = []
+            if raw_records:
+                with self.profiler.stage("curate"):
+                    columns = self.source.get_column_names("monthly")
+                    records = self.curate_records(entity, timeframe, raw_records, columns)
+
+            # Deleting first drops the periods left without monthly records.
+            with self.profiler.stage("persist"):
+                deleted_dates = self.target.delete_gvkeys(timeframe.value, gvkeys, period)
+                if records:
+                    upsert_query = self._queries[entity].UPSERT.format(
+                        timeframe=timeframe.value
+                    )
+                    self.target.execute(upsert_query, records)
+                self._mark_dirty(timeframe.value, deleted_dates + [r[0] for r in records])
+                self.target.commit_transaction()
+
+    def winsorize_returns(self, workers: int = 1, full: bool = False):
+        """Persists winsorized returns, cross-section by cross-section.
+
+        Args:
+            workers: processes winsorizing in parallel, each one fetching and
+                clipping the returns of its share of the dates.
+            full: winsorize every date instead of only the dirty ones.
+        """
+        self._check_unsharded("winsorize_returns")
+        logger.info('Winsorizing returns...')
+        executor = None
+        if workers > 1:
+            # Workers are forked, spawning them would re-run this module.
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=winsorize.init_worker,
+                initargs=(self._source_connection_string,),
+            )
+
+        try:
+            timeframes = ["annual", "quarterly", "monthly", "weekly", "daily"]
+            for timeframe in timeframes:
+                logger.info(f"Processing {timeframe} records...")
+                i = 0
+                for dates in self._dates_to_winsorize(timeframe, full):
+                    logger.debug(f"Processed {i} date intervals.")
+
+                    # In parallel mode this only captures the wait on the workers.
+                    with self.profiler.stage("winsorize"):
+                        if executor is not None:
+                            futures = [
+                                executor.submit(
+                                    winsorize.winsorize_dates_worker, timeframe, dates[w::workers]
+                                )
+                                for w in range(min(workers, len(dates)))
+                            ]
+                            winsorized_returns = []
+                            for future in futures:
+                                winsorized_returns.extend(future.result())
                         else:
-                            history[record.datadate].append(record)
-
-                    winsorized_returns = []
-                    for d, records in history.items():
-                        returns = [(r.datadate, r.gvkey, r.rtn) for r in records]
-                        returns.sort(key=lambda r: r[2])
-                        # CHANGE WINSORIZE FACTOR BELOW IF NEEDED
-                        quantile_index = len(returns) // 20
-                        high_value = returns[-quantile_index][2]
-                        low_value = returns[quantile_index][2]
-
-                        for r in returns:
-                            if r[2] > high_value:
-                                winsorized_returns.append((r[0], r[1], high_value))
-                            elif r[2] < low_value:
-                                winsorized_returns.append((r[0], r[1], low_value))
-                            else:
-                                winsorized_returns.append(r)
-                else:
+                            winsorized_returns = winsorize.winsorize_dates(
+                                self.source, timeframe, dates
+                            )
+                    self.governor.observe("returns", winsorized_returns)
+
+                    with self.profiler.stage("persist"):
+                        upsert_query = queries.WinsorizedReturnsQueries.UPSERT.format(timeframe=timeframe)
+                        self.target.execute(upsert_query, winsorized_returns)
+                        self.target.execute(
+                            queries.DirtyDatesQueries.DELETE, [(timeframe, d) for d in dates]
+                        )
+                        self.target.commit_transaction()
+                    self.profiler.dump(
+                        f"winsorize_{timeframe}_{dates[0]:%Y%m%d}_{dates[-1]:%Y%m%d}"
+                    )
+                    i += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _dates_to_winsorize(self, timeframe: str, full: bool) -> Iterator[List[datetime]]:
+        """Yields the dates to winsorize, a year at a time.
+
+        Args:
+            timeframe: timeframe of the cross-sections.
+            full: yield every date instead of only the dirty ones.
+        """
+        if full:
+            for date_interval in date_helpers.generate_intervals(self.YEARS):
+                with self.profiler.stage("fetch"):
+                    dates = self.source.get_dates(timeframe=timeframe, date_range=date_interval)
+                if not dates:
                     logger.info("No more records to process.")
                     return
+                yield from self._governed_dates(timeframe, dates)
+        else:
+            with self.profiler.stage("fetch"):
+                dirty_dates = self.target.get_dirty_dates(timeframe)
+            dates_per_year: Dict[int, List[datetime]] = {}
+            for d in dirty_dates:
+                dates_per_year.setdefault(d.year, []).append(d)
+            for dates in dates_per_year.values():
+                yield from self._governed_dates(timeframe, dates)
+
+    def _governed_dates(
+        self, timeframe: str, dates: List[datetime]
+    ) -> List[List[datetime]]:
+        """Splits dates into chunks whose returns fit the memory budget."""
+        return self.governor.split(
+            dates,
+            lambda chunk: self.source.count_returns(timeframe, chunk),
+            "returns",
+        )
+
+    def _mark_dirty(self, timeframe: str, dates: Iterable[datetime]) -> None:
+        """Records cross-sections to winsorize again, in the current transaction.
 
-                upsert_query = queries.WinsorizedReturnsQueries.UPSERT.format(timeframe=timeframe)
-                self.target.execute(upsert_query, winsorized_returns)
-                self.target.commit_transaction()
+        Args:
+            timeframe: timeframe of the cross-sections.
+            dates: dates of the changed cross-sections.
+        """
+        dirty_dates = [(timeframe, d) for d in sorted(set(dates))]
+        if dirty_dates:
+            self.target.execute(queries.DirtyDatesQueries.UPSERT, dirty_dates)
+
+    def log_statement_stats(self) -> None:
+        """Logs call counts and latencies of the prepared statements."""
+        self.source.statements.log_stats()
+        self.target.statements.log_stats()
+
+    def _check_unsharded(self, stage: str) -> None:
+        """Raises if a cross-sectional stage is run on a single shard."""
+        if self.shard is not None:
+            raise RuntimeError(
+                f"{stage} needs every gvkey of a date and cannot run on shard {self.shard}."
+            )
 
     @staticmethod
     def list_slicer(lst: List, slice_len: int) -> List[List]:
@@ -244,7 +735,66 @@ class Loader:
         return res
 
 
-loader = Loader()
-loader.run()
-# loader.cleanup()
-loader.winsorize_returns()
+parser = argparse.ArgumentParser(description="Aggregates loader.")
+parser.add_argument(
+    "--shard",
+    type=Shard.parse,
+    default=os.environ.get("SHARD"),
+    help="only aggregate gvkeys with gvkey %% N = i, given as i/N.",
+)
+parser.add_argument(
+    "--stage",
+    choices=["all", "aggregate", "finalize"],
+    default=os.environ.get("STAGE", "all"),
+    help="aggregate builds the per gvkey tables, finalize the cross-sectional ones.",
+)
+parser.add_argument(
+    "--winsorize-workers",
+    type=int,
+    default=int(os.environ.get("WINSORIZE_WORKERS", 1)),
+    help="processes winsorizing dates in parallel.",
+)
+parser.add_argument(
+    "--backfill",
+    action="store_true",
+    help="rebuild every year of the base tables through partition swaps.",
+)
+parser.add_argument(
+    "--full-winsorize",
+    action="store_true",
+    help="winsorize every date instead of only the ones changed since last run.",
+)
+parser.add_argument(
+    "--memory-budget-mb",
+    type=int,
+    default=os.environ.get("MEMORY_BUDGET_MB"),
+    help="split date ranges whose records are estimated over this budget.",
+)
+parser.add_argument(
+    "--profile-dir",
+    default=os.environ.get("PROFILE_DIR"),
+    help="enables profiling, writing per stage dumps to this directory.",
+)
+parser.add_argument(
+    "--profile-modes",
+    default=os.environ.get("PROFILE_MODES", "cprofile"),
+    help="comma separated profilers to use: cprofile, tracemalloc.",
+)
+args = parser.parse_args()
+if args.shard is not None and args.stage != "aggregate":
+    parser.error("--shard can only be used with --stage aggregate.")
+if args.shard is not None and args.backfill:
+    parser.error("--shard cannot be used with --backfill.")
+
+profiler = Profiler(args.profile_dir, modes=args.profile_modes.split(","))
+governor = MemoryGovernor(
+    args.memory_budget_mb * 2**20 if args.memory_budget_mb is not None else None
+)
+loader = Loader(shard=args.shard, profiler=profiler, governor=governor)
+if args.stage in ("all", "aggregate"):
+    loader.run(backfill=args.backfill)
+    loader.compute_rolling_features(full=args.backfill)
+if args.stage in ("all", "finalize"):
+    # loader.cleanup()
+    loader.winsorize_returns(workers=args.winsorize_workers, full=args.full_winsorize)
+loader.log_statement_stats()
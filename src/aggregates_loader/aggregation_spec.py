@@ -0,0 +1,245 @@
+"""Declarative specification of the aggregate base tables.
+
+Each field of a {timeframe}_base table names the reducer aggregating it. The
+specification is compiled into single pass kernels, and generates the upsert
+column list and the table DDL.
+
+Means are persisted with the count of datapoints behind them, in a
+{field}_n column, so rolling them up into coarser timeframes reproduces the
+mean of the underlying daily records, up to the rounding of the persisted
+means.
+
+Usage:
+    python -m aggregates_loader.aggregation_spec weekly > db/weekly_base.sql
+"""
+from decimal import Decimal
+from functools import lru_cache
+import logging
+from math import sqrt
+import sys
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+REDUCERS = ("mean", "max", "min", "rss", "compound", "count")
+
+KEY_COLUMNS = ("datadate", "gvkey")
+
+
+class Field(NamedTuple):
+    """Column of a base table.
+
+    Attributes:
+        name: column name.
+        reducer: reducer aggregating the column, None if it is not aggregated.
+        sql_type: column type.
+        group: fields of a group are laid out together in the DDL.
+    """
+
+    name: str
+    reducer: Optional[str]
+    sql_type: str
+    group: str
+
+
+FIELDS = (
+    Field("utilization_pct", "mean", "DECIMAL(14,8)", "loans"),
+    Field("bar", "mean", "DECIMAL(14,8)", "loans"),
+    Field("age", "mean", "DECIMAL(18,7)", "loans"),
+    Field("tickets", "mean", "DECIMAL(18,2)", "loans"),
+    Field("units", "mean", "DECIMAL(18,4)", "loans"),
+    Field("market_value_usd", "mean", "DECIMAL(18,2)", "loans"),
+    Field("loan_rate_avg", "mean", "DECIMAL(18,9)", "loans"),
+    Field("loan_rate_max", "mean", "DECIMAL(18,9)", "loans"),
+    Field("loan_rate_min", "mean", "DECIMAL(18,9)", "loans"),
+    Field("loan_rate_range", "mean", "DECIMAL(18,9)", "loans"),
+    Field("loan_rate_stdev", "rss", "DECIMAL(18,9)", "loans"),
+    Field("market_cap", "mean", "DECIMAL(30,15)", "market"),
+    Field("shares_out", "mean", "DECIMAL(30,4)", "market"),
+    Field("volume", "mean", "DECIMAL(30,15)", "market"),
+    Field("rtn", "compound", "DECIMAL(25,15)", "market"),
+    Field("winsorized_5_rtn", None, "DECIMAL(25,15)", "market"),
+    Field("dps", "count", "INTEGER", "count"),
+)
+
+AGGREGATED_FIELDS = tuple(f for f in FIELDS if f.reducer is not None)
+
+MEAN_COUNT_FIELDS = tuple(
+    Field(f"{f.name}_n", None, "INTEGER", "mean counts")
+    for f in AGGREGATED_FIELDS
+    if f.reducer == "mean"
+)
+
+# Columns computed by the kernels: aggregated fields, then mean counts.
+OUTPUT_COLUMNS = tuple(f.name for f in AGGREGATED_FIELDS) + tuple(
+    f.name for f in MEAN_COUNT_FIELDS
+)
+
+# Columns of a base table and of the daily records aggregated into it.
+BASE_COLUMNS = KEY_COLUMNS + tuple(f.name for f in FIELDS + MEAN_COUNT_FIELDS)
+DAILY_COLUMNS = KEY_COLUMNS + tuple(
+    f.name for f in AGGREGATED_FIELDS if f.reducer != "count"
+)
+
+# Reducer statements: (init, update, result), {k} is the field number, `v`
+# the column value and, for rollups, {c} the position of its mean count.
+_REDUCERS = {
+    "mean": (
+        "s{k} = 0; n{k} = 0",
+        "if v:\n    s{k} += v\n    n{k} += 1",
+        "Decimal(s{k} / n{k}) if n{k} else None",
+    ),
+    "max": (
+        "m{k} = None",
+        "if v is not None and (m{k} is None or v > m{k}):\n    m{k} = v",
+        "m{k}",
+    ),
+    "min": (
+        "m{k} = None",
+        "if v is not None and (m{k} is None or v < m{k}):\n    m{k} = v",
+        "m{k}",
+    ),
+    "rss": (
+        "s{k} = 0; n{k} = 0",
+        "if v:\n    s{k} += v ** 2\n    n{k} += 1",
+        "sqrt(s{k}) if n{k} else None",
+    ),
+    "compound": (
+        "p{k} = 1; n{k} = 0",
+        "if v is not None:\n    p{k} = p{k} * (1 + v)\n    n{k} += 1",
+        "p{k} - 1 if n{k} else None",
+    ),
+    "count": ("c{k} = 0", "c{k} += 1", "c{k}"),
+}
+
+# Rolling up aggregates weights means by their mean counts and sums the
+# counts, the other reducers compose with themselves. Rows persisted before
+# mean counts existed fall back to their datapoints `w`, which only
+# approximates the daily mean since those include null and zero values.
+_ROLLUP_REDUCERS = {
+    **_REDUCERS,
+    "mean": (
+        "s{k} = 0; n{k} = 0",
+        "c = r[{c}]\n"
+        "if c is None:\n    c = w\n"
+        "if v is not None and c:\n    s{k} += v * c\n    n{k} += c",
+        "Decimal(s{k} / n{k}) if n{k} else None",
+    ),
+    "count": ("c{k} = 0", "c{k} += w", "c{k}"),
+}
+
+
+def _indent(code: str, level: int) -> List[str]:
+    return ["    " * level + line for line in code.split("\n")]
+
+
+@lru_cache(maxsize=None)
+def compile_kernel(
+    columns: Tuple[str, ...], rollup: bool = False
+) -> Callable[[Sequence[Tuple]], Tuple]:
+    """Compiles the aggregated fields into a single pass kernel.
+
+    Args:
+        columns: column names of the records the kernel is applied to.
+        rollup: whether records are aggregates themselves, weighted by their
+            count field, instead of daily records.
+
+    Returns:
+        Function aggregating a list of records into the values of
+        OUTPUT_COLUMNS.
+    """
+    index = {name: i for i, name in enumerate(columns)}
+    reducers = _ROLLUP_REDUCERS if rollup else _REDUCERS
+    count_field = next(f for f in AGGREGATED_FIELDS if f.reducer == "count")
+
+    init, update, result, counts = [], [], [], []
+    if rollup:
+        if count_field.name not in index:
+            raise ValueError(f"Missing count column {count_field.name} in {columns}.")
+        update.append(f"w = r[{index[count_field.name]}] or 0")
+    for k, field in enumerate(AGGREGATED_FIELDS):
+        field_init, field_update, field_result = reducers[field.reducer]
+        init.append(field_init.format(k=k))
+        if field.reducer != "count":
+            if field.name not in index:
+                raise ValueError(f"Missing column {field.name} in {columns}.")
+            update.append(f"v = r[{index[field.name]}]")
+        if field.reducer == "mean":
+            count_column = f"{field.name}_n"
+            if rollup and count_column not in index:
+                raise ValueError(f"Missing mean count column {count_column} in {columns}.")
+            update.append(field_update.format(k=k, c=index.get(count_column)))
+            counts.append(f"n{k},")
+        else:
+            update.append(field_update.format(k=k))
+        result.append(field_result.format(k=k) + ",")
+    result += counts
+
+    source = "\n".join(
+        ["def kernel(records):"]
+        + _indent("\n".join(init), 1)
+        + ["    for r in records:"]
+        + _indent("\n".join(update), 2)
+        + ["    return ("]
+        + _indent("\n".join(result), 2)
+        + ["    )"]
+    )
+    logger.debug(f"Compiled aggregation kernel:\n{source}")
+
+    namespace = {"Decimal": Decimal, "sqrt": sqrt}
+    exec(compile(source, "<aggregation kernel>", "exec"), namespace)
+    return namespace["kernel"]
+
+
+def upsert_query() -> str:
+    """Builds the upsert of the aggregated fields into {timeframe}_base."""
+    columns = KEY_COLUMNS + OUTPUT_COLUMNS
+    return (
+        "INSERT INTO {timeframe}_base ("
+        + ", ".join(columns)
+        + ") VALUES %s "
+        "ON CONFLICT (datadate, gvkey) DO "
+        "UPDATE SET "
+        + ", ".join(f"{c}=EXCLUDED.{c}" for c in columns)
+        + "; "
+    )
+
+
+def insert_staging_query() -> str:
+    """Builds the plain insert into the staging table of a yearly partition."""
+    columns = KEY_COLUMNS + OUTPUT_COLUMNS
+    return (
+        "INSERT INTO {timeframe}_base_{year}_staging ("
+        + ", ".join(columns)
+        + ") VALUES %s; "
+    )
+
+
+def create_table_ddl(table: str) -> str:
+    """Builds the DDL of a base table.
+
+    Base tables are partitioned by datadate ranges, the loader creates one
+    partition per year, named {table}_{year}.
+
+    Args:
+        table: table name.
+
+    Returns:
+        CREATE TABLE statement.
+    """
+    lines = [f"CREATE TABLE {table}", "("]
+    lines += [f"    {'datadate':<36}TIMESTAMP,", f"    {'gvkey':<36}INTEGER,"]
+    group = None
+    for field in FIELDS + MEAN_COUNT_FIELDS:
+        if field.group != group:
+            lines.append("")
+            group = field.group
+        lines.append(f"    {field.name:<36}{field.sql_type},")
+    lines += ["", "    PRIMARY KEY (gvkey, datadate)", ") PARTITION BY RANGE (datadate);"]
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    for timeframe in sys.argv[1:]:
+        sys.stdout.write(create_table_ddl(f"{timeframe}_base"))
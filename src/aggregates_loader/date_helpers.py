@@ -1,6 +1,6 @@
 """Helper functions to deal with timeframes."""
 from datetime import datetime, timedelta
-from typing import List
+from typing import Callable, List, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,6 +23,22 @@ def is_month_end(d: datetime) -> bool:
         return False
 
 
+def is_quarter_end(d: datetime) -> bool:
+    """Checks if date is the end of the quarter."""
+    if is_month_end(d) and d.month % 3 == 0:
+        return True
+    else:
+        return False
+
+
+def is_year_end(d: datetime) -> bool:
+    """Checks if date is the end of the year."""
+    if d.month == 12 and d.day == 31:
+        return True
+    else:
+        return False
+
+
 def get_week_end(d: datetime) -> datetime:
     """Checks if date is the end of the week."""
     return d + timedelta(days=4 - d.weekday())
@@ -34,6 +50,34 @@ def get_month_end(d: datetime) -> datetime:
     return next_month - timedelta(days=next_month.day)
 
 
+def get_quarter_end(d: datetime) -> datetime:
+    """Gets the end of the quarter of the date."""
+    return get_month_end(d.replace(day=1, month=(d.month - 1) // 3 * 3 + 3))
+
+
+def get_year_end(d: datetime) -> datetime:
+    """Gets the end of the year of the date."""
+    return d.replace(month=12, day=31)
+
+
+def get_period_bounds(
+    get_period_end: Callable[[datetime], datetime], period_end: datetime
+) -> Tuple[datetime, datetime]:
+    """Gets the first and last days binned into the period ending on period_end.
+
+    Weekend days are binned into the previous week, so weekly periods run
+    from monday to sunday, including those crossing the end of a year.
+    """
+    first_day = period_end
+    while get_period_end(first_day - timedelta(days=1)) == period_end:
+        first_day = first_day - timedelta(days=1)
+    last_day = period_end
+    while get_period_end(last_day + timedelta(days=1)) == period_end:
+        last_day = last_day + timedelta(days=1)
+
+    return first_day, last_day
+
+
 def generate_weeks(years: List[int]):
     weeks = []
     for year in years:
@@ -64,6 +108,25 @@ def generate_months(years: List[int]):
     return months
 
 
+def generate_quarters(years: List[int]):
+    quarters = []
+    for year in years:
+        temp_d = datetime(year, 1, 1)
+        quarter_start = temp_d
+        while temp_d.year == year:
+            if temp_d.day == 1 and temp_d.month % 3 == 1:
+                quarter_start = temp_d
+            if is_quarter_end(temp_d):
+                quarters.append((quarter_start, temp_d))
+            temp_d = temp_d + timedelta(days=1)
+
+    return quarters
+
+
+def generate_years(years: List[int]):
+    return [(datetime(year, 1, 1), datetime(year, 12, 31)) for year in years]
+
+
 def generate_intervals(years: List[int]):
     intervals = []
     for year in years:
@@ -0,0 +1,87 @@
+"""Memory budget governor."""
+import logging
+import sys
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Initial in-memory size estimates per fetched row, refined by observe.
+DEFAULT_BYTES_PER_ROW = {
+    "records": 2000,
+    "returns": 300,
+}
+
+# Rows measured per observation.
+SAMPLE_SIZE = 100
+
+
+class MemoryGovernor:
+    """Splits chunks of periods whose rows would exceed a memory budget.
+
+    Chunks are lists of whole periods (weeks, months or dates) and parts
+    keep whole periods together. Splitting only preserves results if every
+    part then fetches all the records binned into its periods, e.g. the
+    Loader fetches contiguous, bin-aligned date ranges, see
+    Loader._date_range. Without a budget chunks are returned unchanged and
+    no rows are counted.
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None) -> None:
+        self.budget_bytes = budget_bytes
+        self.bytes_per_row: Dict[str, float] = dict(DEFAULT_BYTES_PER_ROW)
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes is not None
+
+    def split(
+        self, chunk: List[T], count_rows: Callable[[List[T]], int], kind: str
+    ) -> List[List[T]]:
+        """Recursively halves a chunk until each part fits the budget.
+
+        Args:
+            chunk: consecutive periods.
+            count_rows: counts the rows fetched for a chunk.
+            kind: kind of rows, see DEFAULT_BYTES_PER_ROW.
+
+        Returns:
+            Parts of the chunk, in order.
+        """
+        if not self.enabled or not chunk:
+            return [chunk]
+
+        estimated_bytes = count_rows(chunk) * self.bytes_per_row[kind]
+        if estimated_bytes <= self.budget_bytes:
+            return [chunk]
+        if len(chunk) == 1:
+            logger.warning(
+                f"Single period {chunk[0]} estimated at {estimated_bytes / 2**20:.0f} MiB, "
+                "over the memory budget."
+            )
+            return [chunk]
+
+        middle = len(chunk) // 2
+        return self.split(chunk[:middle], count_rows, kind) + self.split(
+            chunk[middle:], count_rows, kind
+        )
+
+    def observe(self, kind: str, rows: Sequence[Tuple]) -> None:
+        """Updates the size estimate of a kind of rows from fetched rows.
+
+        The estimate only grows, so later chunks are never underestimated
+        because of a sample of small rows.
+
+        Args:
+            kind: kind of rows, see DEFAULT_BYTES_PER_ROW.
+            rows: fetched rows.
+        """
+        if not self.enabled or not rows:
+            return
+
+        sample = rows[:: max(len(rows) // SAMPLE_SIZE, 1)]
+        observed = sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row) for row in sample
+        ) / len(sample)
+        self.bytes_per_row[kind] = max(self.bytes_per_row[kind], observed)
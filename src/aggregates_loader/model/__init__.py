@@ -2,6 +2,7 @@
 
 from .aggregate_base import AggregateBase
 from .base_data import BaseData
+from .rolling_features import RollingFeatures
 
 
-__all__ = ["AggregateBase", "BaseData"]
+__all__ = ["AggregateBase", "BaseData", "RollingFeatures"]
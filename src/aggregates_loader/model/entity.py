@@ -7,6 +7,7 @@ class Entity(str, Enum):
     """Entities."""
 
     aggregate_base = "aggregate_base"
+    rolling_features = "rolling_features"
 
     def __repr__(self) -> str:
         return str(self.value)
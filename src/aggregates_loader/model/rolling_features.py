@@ -0,0 +1,89 @@
+"""Rolling features model."""
+
+from datetime import datetime
+from decimal import Decimal
+import logging
+from typing import List, Optional, Tuple
+
+from aggregates_loader.model.base import Modeling
+
+logger = logging.getLogger(__name__)
+
+
+class RollingFeatures(Modeling):
+    """Rolling features record object class."""
+
+    # Window sizes, in periods of the underlying timeframe.
+    WINDOWS = (4, 12, 52)
+
+    datadate: datetime
+    gvkey: int
+
+    rtn_mean_4: Optional[Decimal] = None
+    rtn_stdev_4: Optional[Decimal] = None
+    utilization_pct_mean_4: Optional[Decimal] = None
+
+    rtn_mean_12: Optional[Decimal] = None
+    rtn_stdev_12: Optional[Decimal] = None
+    utilization_pct_mean_12: Optional[Decimal] = None
+
+    rtn_mean_52: Optional[Decimal] = None
+    rtn_stdev_52: Optional[Decimal] = None
+    utilization_pct_mean_52: Optional[Decimal] = None
+
+    @classmethod
+    def build_record(
+        cls, key: Tuple[datetime, int], records: List[Tuple]
+    ) -> "RollingFeatures":
+        """Builds Rolling Features record object.
+
+        Args:
+            key: datetime, gvkey.
+            records: (window, rtn mean, rtn stdev, utilization pct mean)
+                for each window in WINDOWS.
+
+        Returns:
+            Returns record object.
+        """
+        res = cls()
+
+        res.datadate = key[0]
+        res.gvkey = key[1]
+
+        for window, rtn_mean, rtn_stdev, utilization_pct_mean in records:
+            setattr(res, f"rtn_mean_{window}", rtn_mean)
+            setattr(res, f"rtn_stdev_{window}", rtn_stdev)
+            setattr(res, f"utilization_pct_mean_{window}", utilization_pct_mean)
+
+        return res
+
+    def as_tuple(self) -> Tuple:
+        """Get tuple with object attributes.
+
+        Returns:
+            Tuple with object attributes.
+        """
+        return (
+            self.datadate,
+            self.gvkey,
+            self.rtn_mean_4,
+            self.rtn_stdev_4,
+            self.utilization_pct_mean_4,
+            self.rtn_mean_12,
+            self.rtn_stdev_12,
+            self.utilization_pct_mean_12,
+            self.rtn_mean_52,
+            self.rtn_stdev_52,
+            self.utilization_pct_mean_52,
+        )
+
+    @property
+    def is_empty(self):
+        # The largest window holds every value of the smaller ones.
+        if (
+            self.rtn_mean_52 is None
+            and self.utilization_pct_mean_52 is None
+        ):
+            return True
+        else:
+            return False
@@ -1,10 +1,13 @@
 """Source."""
 
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import psycopg2
 import psycopg2.extensions
 
+from aggregates_loader.persistence.statements import StatementRegistry
+from aggregates_loader.shard import Shard, shard_filter
+
 
 class Source:
     """Source class."""
@@ -14,6 +17,8 @@ class Source:
         self._connection = psycopg2.connect(connection_string)
         self._connection.autocommit = False
         self._tx_cursor = None
+        self._column_names: Dict[str, Tuple[str, ...]] = {}
+        self.statements = StatementRegistry()
 
     @property
     def cursor(self) -> psycopg2.extensions.cursor:
@@ -29,20 +34,223 @@ class Source:
 
         return cursor
 
-    def get_records(self, timeframe, date_range) -> List[Tuple]:
+    def get_records(
+        self, timeframe, date_range, shard: Optional[Shard] = None
+    ) -> List[Tuple]:
         """Fetch records with the provided keys.
 
         Args:
             timeframe: timeframe to get records from.
             date_range: date range to get records from.
+            shard: only fetch the gvkeys of this shard.
+
+        Returns:
+            List of records with matching keys.
+        """
+        cursor = self.cursor
+        name = f"get_records_{timeframe}"
+        shard_condition = ""
+        params = (date_range[0], date_range[1])
+        if shard is not None:
+            name += "_sharded"
+            shard_condition = "AND gvkey % $3 = $4 "
+            params += (shard.count, shard.index)
+        query = (
+            "SELECT * "
+            "FROM {timeframe}_base "
+            "WHERE datadate BETWEEN $1 AND $2 "
+            "{shard_condition}"
+            "ORDER BY datadate"
+        ).format(timeframe=timeframe, shard_condition=shard_condition)
+
+        self.statements.execute(cursor, name, query, params)
+        res = cursor.fetchall()
+
+        return res if res else None
+
+    def get_gvkey_records(self, timeframe, gvkeys, date_range) -> List[Tuple]:
+        """Fetch the records of gvkeys in a date range.
+
+        Args:
+            timeframe: timeframe to get records from.
+            gvkeys: gvkeys to get records from.
+            date_range: date range to get records from.
 
         Returns:
             List of records with matching keys.
         """
         cursor = self.cursor
-        query = ("SELECT * " "FROM {timeframe}_base " "WHERE datadate BETWEEN %s AND %s ORDER BY datadate; ").format(timeframe=timeframe)
+        query = (
+            "SELECT * "
+            "FROM {timeframe}_base "
+            "WHERE gvkey = ANY($1) AND datadate BETWEEN $2 AND $3 "
+            "ORDER BY datadate"
+        ).format(timeframe=timeframe)
+
+        self.statements.execute(
+            cursor,
+            f"get_gvkey_records_{timeframe}",
+            query,
+            (list(gvkeys), date_range[0], date_range[1]),
+        )
+        res = cursor.fetchall()
+
+        return res if res else None
+
+    def count_records(
+        self, timeframe, date_range, shard: Optional[Shard] = None
+    ) -> int:
+        """Count the records get_records would fetch.
+
+        Args:
+            timeframe: timeframe to count records from.
+            date_range: date range to count records from.
+            shard: only count the gvkeys of this shard.
+
+        Returns:
+            Number of records.
+        """
+        cursor = self.cursor
+        name = f"count_records_{timeframe}"
+        shard_condition = ""
+        params = (date_range[0], date_range[1])
+        if shard is not None:
+            name += "_sharded"
+            shard_condition = "AND gvkey % $3 = $4 "
+            params += (shard.count, shard.index)
+        query = (
+            "SELECT COUNT(*) "
+            "FROM {timeframe}_base "
+            "WHERE datadate BETWEEN $1 AND $2 "
+            "{shard_condition}"
+        ).format(timeframe=timeframe, shard_condition=shard_condition)
+
+        self.statements.execute(cursor, name, query, params)
+
+        return cursor.fetchone()[0]
+
+    def count_returns(self, timeframe, dates) -> int:
+        """Count the returns get_returns would fetch.
+
+        Args:
+            timeframe: timeframe to count returns from.
+            dates: dates to count returns from.
+
+        Returns:
+            Number of returns.
+        """
+        cursor = self.cursor
+        query = (
+            "SELECT COUNT(*) "
+            "FROM {timeframe}_base "
+            "WHERE datadate = ANY($1) AND rtn IS NOT NULL"
+        ).format(timeframe=timeframe)
+
+        self.statements.execute(cursor, f"count_returns_{timeframe}", query, (list(dates),))
+
+        return cursor.fetchone()[0]
+
+    def get_column_names(self, timeframe) -> Tuple[str, ...]:
+        """Fetch the column names of a base table, in SELECT * order.
+
+        Args:
+            timeframe: timeframe of the table.
+
+        Returns:
+            Column names.
+        """
+        if timeframe not in self._column_names:
+            cursor = self.cursor
+            query = "SELECT * FROM {timeframe}_base LIMIT 0; ".format(timeframe=timeframe)
+            cursor.execute(query)
+            self._column_names[timeframe] = tuple(d[0] for d in cursor.description)
+
+        return self._column_names[timeframe]
+
+    def get_dates(self, timeframe, date_range) -> List:
+        """Fetch the distinct dates with records in a date range.
+
+        Args:
+            timeframe: timeframe to get dates from.
+            date_range: date range to get dates from.
+
+        Returns:
+            Sorted list of dates.
+        """
+        cursor = self.cursor
+        query = (
+            "SELECT DISTINCT datadate "
+            "FROM {timeframe}_base "
+            "WHERE datadate BETWEEN %s AND %s ORDER BY datadate; "
+        ).format(timeframe=timeframe)
 
         cursor.execute(query, (date_range[0], date_range[1]))
         res = cursor.fetchall()
 
+        return [r[0] for r in res]
+
+    def get_returns(self, timeframe, dates) -> List[Tuple]:
+        """Fetch the returns of the given dates.
+
+        Args:
+            timeframe: timeframe to get returns from.
+            dates: dates to get returns from.
+
+        Returns:
+            List of (datadate, gvkey, rtn) records.
+        """
+        cursor = self.cursor
+        query = (
+            "SELECT datadate, gvkey, rtn "
+            "FROM {timeframe}_base "
+            "WHERE datadate = ANY($1) AND rtn IS NOT NULL"
+        ).format(timeframe=timeframe)
+
+        self.statements.execute(cursor, f"get_returns_{timeframe}", query, (list(dates),))
+        res = cursor.fetchall()
+
         return res if res else None
+
+    def stream_records(
+        self,
+        timeframe,
+        date_range,
+        shard: Optional[Shard] = None,
+        gvkeys: Optional[List[int]] = None,
+        itersize=10000,
+    ) -> Iterator[Tuple]:
+        """Stream the rolling features inputs ordered by gvkey and date.
+
+        A server side cursor is used so only `itersize` records are held in
+        memory at once.
+
+        Args:
+            timeframe: timeframe to get records from.
+            date_range: date range to get records from.
+            shard: only fetch the gvkeys of this shard.
+            gvkeys: only fetch these gvkeys.
+            itersize: records fetched per round trip.
+
+        Returns:
+            Iterator of (datadate, gvkey, utilization_pct, rtn) records.
+        """
+        cursor = self._connection.cursor(name="stream_records")
+        cursor.itersize = itersize
+        shard_condition, shard_params = shard_filter(shard)
+        if gvkeys is not None:
+            shard_condition += "AND gvkey = ANY(%s) "
+            shard_params += (list(gvkeys),)
+        query = (
+            "SELECT datadate, gvkey, utilization_pct, rtn "
+            "FROM {timeframe}_base "
+            "WHERE datadate BETWEEN %s AND %s "
+            "{shard_condition}"
+            "ORDER BY gvkey, datadate; "
+        ).format(timeframe=timeframe, shard_condition=shard_condition)
+
+        cursor.execute(query, (date_range[0], date_range[1]) + shard_params)
+        try:
+            for record in cursor:
+                yield record
+        finally:
+            cursor.close()
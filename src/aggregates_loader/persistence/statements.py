@@ -0,0 +1,86 @@
+"""Server side prepared statements."""
+from bisect import bisect_left
+import logging
+import time
+from typing import Dict, List, Set, Tuple
+
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+class StatementStats:
+    """Call count and latency histogram of a statement."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total_seconds = 0.0
+        # Last bucket counts calls slower than every bound.
+        self.histogram: List[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, seconds: float) -> None:
+        """Adds a call to the stats.
+
+        Args:
+            seconds: duration of the call.
+        """
+        self.calls += 1
+        self.total_seconds += seconds
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def __str__(self) -> str:
+        buckets = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        histogram = ", ".join(
+            f"{b}: {c}" for b, c in zip(buckets, self.histogram) if c
+        )
+        mean_ms = self.total_seconds * 1000 / self.calls if self.calls else 0
+        return f"{self.calls} calls, mean {mean_ms:.2f}ms ({histogram})"
+
+
+class StatementRegistry:
+    """Prepares statements once per connection and executes them by name.
+
+    Statements are written with postgres `$n` placeholders and prepared on
+    their first execution, later executions skip parsing and planning.
+    A registry must only be used with the connection it was created for.
+    """
+
+    def __init__(self) -> None:
+        self._prepared: Set[str] = set()
+        self.stats: Dict[str, StatementStats] = {}
+
+    def execute(
+        self,
+        cursor: psycopg2.extensions.cursor,
+        name: str,
+        query: str,
+        params: Tuple = (),
+    ) -> None:
+        """Executes a prepared statement, preparing it if needed.
+
+        Args:
+            cursor: cursor of the registry connection.
+            name: statement name, one per distinct query.
+            query: query with `$n` placeholders.
+            params: query parameters.
+        """
+        if name not in self._prepared:
+            cursor.execute(f"PREPARE {name} AS {query}")
+            self._prepared.add(name)
+            self.stats[name] = StatementStats()
+
+        execute_query = f"EXECUTE {name}"
+        if params:
+            execute_query += f" ({', '.join(['%s'] * len(params))})"
+
+        start = time.perf_counter()
+        cursor.execute(execute_query, params)
+        self.stats[name].record(time.perf_counter() - start)
+
+    def log_stats(self) -> None:
+        """Logs the stats of every executed statement."""
+        for name, stats in sorted(self.stats.items()):
+            logger.info(f"Statement {name}: {stats}")
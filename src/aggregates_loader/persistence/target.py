@@ -1,16 +1,22 @@
 """Target."""
 
-from typing import List, Tuple
+from datetime import datetime
+from typing import List, Optional, Tuple
 
 import psycopg2
+import psycopg2.errors
 import psycopg2.extensions
 from psycopg2.extras import execute_values
 
 import aggregates_loader.date_helpers as date_helpers
+from aggregates_loader.persistence.statements import StatementRegistry
+from aggregates_loader.shard import Shard, shard_filter
 
 PERIOD_ENDS = {
     "weekly": date_helpers.is_week_end,
     "monthly": date_helpers.is_month_end,
+    "quarterly": date_helpers.is_quarter_end,
+    "annual": date_helpers.is_year_end,
 }
 
 
@@ -22,6 +28,7 @@ class Target:
         self._connection = psycopg2.connect(connection_string)
         self._connection.autocommit = False
         self._tx_cursor = None
+        self.statements = StatementRegistry()
 
     @property
     def cursor(self) -> psycopg2.extensions.cursor:
@@ -41,45 +48,212 @@ class Target:
         """Commits a transaction."""
         self._connection.commit()
 
-    def execute(self, query: str, records: List[Tuple]) -> None:
+    def execute(self, query: str, records: List[Tuple], page_size: int = 100) -> None:
         """Execute batch of records into database.
 
         Args:
             query: query to execute.
             records: records to persist.
+            page_size: records per statement.
         """
         cursor = self.cursor
-        execute_values(cur=cursor, sql=query, argslist=records)
+        execute_values(cur=cursor, sql=query, argslist=records, page_size=page_size)
 
-    def get_last_persisted_date(self, timeframe) -> List[Tuple]:
+    def get_dirty_dates(self, timeframe) -> List[datetime]:
+        """Fetch the dates whose cross-section changed since last winsorized.
+
+        Args:
+            timeframe: timeframe of the cross-sections.
+
+        Returns:
+            Sorted list of dates.
+        """
+        cursor = self.cursor
+        query = "SELECT datadate FROM dirty_dates WHERE timeframe = %s ORDER BY datadate;"
+        cursor.execute(query, (timeframe,))
+        dates = cursor.fetchall()
+
+        return [d[0] for d in dates]
+
+    def is_partitioned(self, timeframe) -> bool:
+        """Checks if a base table is partitioned, see db/migrations.
+
+        Args:
+            timeframe: timeframe of the base table.
+
+        Returns:
+            Whether the table is partitioned.
+        """
+        cursor = self.cursor
+        query = "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);"
+        cursor.execute(query, (f"{timeframe}_base",))
+        partitioned = cursor.fetchone()
+
+        return bool(partitioned and partitioned[0])
+
+    def create_partition(self, timeframe, year) -> None:
+        """Creates the yearly partition of a base table if it does not exist.
+
+        Concurrent loaders, e.g. shards, may race to create the same
+        partition: IF NOT EXISTS does not cover that, so the losing creation
+        is rolled back to a savepoint and ignored.
+
+        Args:
+            timeframe: timeframe of the base table.
+            year: year of the partition.
+        """
+        cursor = self.cursor
+        query = (
+            "CREATE TABLE IF NOT EXISTS {timeframe}_base_{year} "
+            "PARTITION OF {timeframe}_base FOR VALUES FROM (%s) TO (%s); "
+        ).format(timeframe=timeframe, year=year)
+        cursor.execute("SAVEPOINT create_partition;")
+        try:
+            cursor.execute(query, (datetime(year, 1, 1), datetime(year + 1, 1, 1)))
+        except (psycopg2.errors.DuplicateTable, psycopg2.errors.UniqueViolation):
+            cursor.execute("ROLLBACK TO SAVEPOINT create_partition;")
+        else:
+            cursor.execute("RELEASE SAVEPOINT create_partition;")
+
+    def create_staging(self, timeframe, year) -> None:
+        """Creates an empty, unindexed staging table for a yearly partition.
+
+        Args:
+            timeframe: timeframe of the base table.
+            year: year of the partition.
+        """
+        cursor = self.cursor
+        query = (
+            "DROP TABLE IF EXISTS {timeframe}_base_{year}_staging; "
+            "CREATE TABLE {timeframe}_base_{year}_staging "
+            "(LIKE {timeframe}_base INCLUDING DEFAULTS); "
+        ).format(timeframe=timeframe, year=year)
+        cursor.execute(query)
+
+    def swap_partition(self, timeframe, year) -> None:
+        """Indexes the staging table and swaps it in as the yearly partition.
+
+        The range check added before attaching lets postgres skip the scan
+        validating the partition bounds.
+
+        Args:
+            timeframe: timeframe of the base table.
+            year: year of the partition.
+        """
+        cursor = self.cursor
+        bounds = (datetime(year, 1, 1), datetime(year + 1, 1, 1))
+        query = (
+            "ALTER TABLE {timeframe}_base_{year}_staging "
+            "ADD PRIMARY KEY (gvkey, datadate), "
+            "ADD CONSTRAINT {timeframe}_base_{year}_range "
+            "CHECK (datadate >= %s AND datadate < %s); "
+            "DROP TABLE IF EXISTS {timeframe}_base_{year}; "
+            "ALTER TABLE {timeframe}_base_{year}_staging "
+            "RENAME TO {timeframe}_base_{year}; "
+            "ALTER INDEX {timeframe}_base_{year}_staging_pkey "
+            "RENAME TO {timeframe}_base_{year}_pkey; "
+            "ALTER TABLE {timeframe}_base "
+            "ATTACH PARTITION {timeframe}_base_{year} FOR VALUES FROM (%s) TO (%s); "
+            "ALTER TABLE {timeframe}_base_{year} "
+            "DROP CONSTRAINT {timeframe}_base_{year}_range; "
+        ).format(timeframe=timeframe, year=year)
+        cursor.execute(query, bounds + bounds)
+
+    def get_last_persisted_date(
+        self, timeframe, table="base", shard: Optional[Shard] = None
+    ) -> List[Tuple]:
         """Fetch last persisted date for the given timeframe.
 
+        Args:
+            timeframe: timeframe of the table.
+            table: table suffix, {timeframe}_{table} is queried.
+            shard: only consider the gvkeys of this shard.
+
         Returns:
             Last persisted date.
         """
         cursor = self.cursor
-        query = ("SELECT MAX(datadate) " "FROM {timeframe}_base; ").format(
-            timeframe=timeframe
-        )
+        shard_condition, shard_params = shard_filter(shard)
+        query = (
+            "SELECT MAX(datadate) "
+            "FROM {timeframe}_{table} "
+            "WHERE TRUE {shard_condition}; "
+        ).format(timeframe=timeframe, table=table, shard_condition=shard_condition)
 
-        cursor.execute(query)
+        cursor.execute(query, shard_params)
         date = cursor.fetchone()
 
         return date[0] if date else None
 
+    def delete_rolling_features(
+        self,
+        timeframe,
+        first_date,
+        shard: Optional[Shard] = None,
+        gvkeys: Optional[List[int]] = None,
+    ) -> None:
+        """Deletes the rolling features from a date on, in the current transaction.
+
+        Args:
+            timeframe: timeframe of the rolling features table.
+            first_date: first date to delete.
+            shard: only delete the gvkeys of this shard.
+            gvkeys: only delete these gvkeys.
+        """
+        cursor = self.cursor
+        shard_condition, shard_params = shard_filter(shard)
+        if gvkeys is not None:
+            shard_condition += "AND gvkey = ANY(%s) "
+            shard_params += (list(gvkeys),)
+        query = (
+            "DELETE FROM {timeframe}_rolling_features "
+            "WHERE datadate >= %s {shard_condition}; "
+        ).format(timeframe=timeframe, shard_condition=shard_condition)
+
+        cursor.execute(query, (first_date,) + shard_params)
+
     def get_max_dps(self, month):
         """Gets the maximum datapoints from the monthly_base table."""
         cursor = self.cursor
-        query = "SELECT MAX(dps) FROM monthly_base WHERE datadate BETWEEN %s AND %s;"
-        cursor.execute(query, (month[0], month[1]))
+        query = "SELECT MAX(dps) FROM monthly_base WHERE datadate BETWEEN $1 AND $2"
+        self.statements.execute(cursor, "get_max_dps", query, (month[0], month[1]))
         dps = cursor.fetchone()
 
         return dps[0] if dps else None
 
     def get_non_traded_gvkeys(self, dps, month_start, month_end):
         cursor = self.cursor
-        query = "SELECT gvkey from monthly_base WHERE dps < %s AND datadate BETWEEN %s AND %s;"
-        cursor.execute(query, (dps, month_start, month_end))
+        query = "SELECT gvkey from monthly_base WHERE dps < $1 AND datadate BETWEEN $2 AND $3"
+        self.statements.execute(
+            cursor, "get_non_traded_gvkeys", query, (dps, month_start, month_end)
+        )
         gvkeys = cursor.fetchall()
 
         return gvkeys if gvkeys else None
+
+    def delete_gvkeys(self, timeframe, gvkeys, date_range) -> List[datetime]:
+        """Deletes the records of gvkeys in a date range.
+
+        Args:
+            timeframe: timeframe of the base table.
+            gvkeys: gvkeys to delete.
+            date_range: date range to delete.
+
+        Returns:
+            Dates of the deleted records.
+        """
+        cursor = self.cursor
+        query = (
+            "DELETE FROM {timeframe}_base "
+            "WHERE gvkey = ANY($1) AND datadate BETWEEN $2 AND $3 "
+            "RETURNING datadate"
+        ).format(timeframe=timeframe)
+        self.statements.execute(
+            cursor,
+            f"delete_gvkeys_{timeframe}",
+            query,
+            (list(gvkeys), date_range[0], date_range[1]),
+        )
+        dates = cursor.fetchall()
+
+        return [d[0] for d in dates]
@@ -0,0 +1,105 @@
+"""Opt-in per stage profiling."""
+from contextlib import nullcontext
+import cProfile
+import logging
+import os
+import re
+import tracemalloc
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "tracemalloc")
+
+_DISABLED_STAGE = nullcontext()
+
+
+class Profiler:
+    """Profiles named stages and dumps the results per date range.
+
+    When no directory is configured, `stage` returns a shared no-op context
+    manager, so instrumented code only pays for an attribute lookup and a
+    method call.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        modes: Iterable[str] = ("cprofile",),
+        top_n: int = 25,
+    ) -> None:
+        self.directory = directory
+        self.enabled = directory is not None
+        self.modes = set(modes)
+        unknown_modes = self.modes - set(MODES)
+        if unknown_modes:
+            raise ValueError(f"Unknown profiling modes {sorted(unknown_modes)}.")
+        self.top_n = top_n
+
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        self._allocations: Dict[str, List[str]] = {}
+
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            if "tracemalloc" in self.modes and not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def stage(self, name: str):
+        """Context manager profiling the enclosed code as stage `name`.
+
+        Stages must not be nested.
+        """
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _Stage(self, name)
+
+    def dump(self, label: str) -> None:
+        """Writes the stages profiled since the last dump.
+
+        Args:
+            label: prefix of the written files, usually the date range.
+        """
+        if not self.enabled:
+            return
+
+        label = re.sub(r"[^\w.-]+", "_", label)
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(self.directory, f"{label}.{name}.pstats"))
+        for name, lines in self._allocations.items():
+            path = os.path.join(self.directory, f"{label}.{name}.tracemalloc.txt")
+            with open(path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+        logger.debug(f"Dumped profiles for {label}.")
+
+        self._profiles = {}
+        self._allocations = {}
+
+
+class _Stage:
+    """Profiled stage, see Profiler.stage."""
+
+    def __init__(self, profiler: Profiler, name: str) -> None:
+        self._profiler = profiler
+        self._name = name
+        self._snapshot = None
+
+    def __enter__(self) -> None:
+        if "tracemalloc" in self._profiler.modes:
+            tracemalloc.reset_peak()
+            self._snapshot = tracemalloc.take_snapshot()
+        if "cprofile" in self._profiler.modes:
+            profile = self._profiler._profiles.get(self._name)
+            if profile is None:
+                profile = self._profiler._profiles[self._name] = cProfile.Profile()
+            profile.enable()
+
+    def __exit__(self, *exc_info) -> None:
+        if "cprofile" in self._profiler.modes:
+            self._profiler._profiles[self._name].disable()
+        if "tracemalloc" in self._profiler.modes:
+            _, peak = tracemalloc.get_traced_memory()
+            stats = tracemalloc.take_snapshot().compare_to(self._snapshot, "lineno")
+            lines = self._profiler._allocations.setdefault(self._name, [])
+            lines.append(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB")
+            lines.extend(str(stat) for stat in stats[: self._profiler.top_n])
+            self._snapshot = None
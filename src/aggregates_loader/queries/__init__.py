@@ -1,7 +1,14 @@
 """Queries implementation."""
 
 from .aggregate_base import Queries as AggregateBaseQueries
+from .dirty_dates import Queries as DirtyDatesQueries
+from .rolling_features import Queries as RollingFeaturesQueries
 from .winsorized_returns import Queries as WinsorizedReturnsQueries
 
 
-__all__ = ["AggregateBaseQueries", "WinsorizedReturnsQueries"]
+__all__ = [
+    "AggregateBaseQueries",
+    "DirtyDatesQueries",
+    "RollingFeaturesQueries",
+    "WinsorizedReturnsQueries",
+]
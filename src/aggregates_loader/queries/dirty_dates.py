@@ -0,0 +1,20 @@
+"""Dirty dates queries."""
+
+from .base import BaseQueries
+
+
+class Queries(BaseQueries):
+    """Dirty dates queries class."""
+
+    UPSERT = (
+        "INSERT INTO dirty_dates ("
+        "       timeframe, "
+        "       datadate"
+        ") VALUES %s "
+        "ON CONFLICT (timeframe, datadate) DO NOTHING; "
+    )
+
+    DELETE = (
+        "DELETE FROM dirty_dates "
+        "WHERE (timeframe, datadate) IN (VALUES %s); "
+    )
@@ -0,0 +1,34 @@
+"""Rolling features queries."""
+
+from .base import BaseQueries
+
+
+class Queries(BaseQueries):
+    """Rolling features queries class."""
+
+    UPSERT = (
+        "INSERT INTO {timeframe}_rolling_features ("
+        "       datadate, "
+        "       gvkey, "
+        "       rtn_mean_4, "
+        "       rtn_stdev_4, "
+        "       utilization_pct_mean_4, "
+        "       rtn_mean_12, "
+        "       rtn_stdev_12, "
+        "       utilization_pct_mean_12, "
+        "       rtn_mean_52, "
+        "       rtn_stdev_52, "
+        "       utilization_pct_mean_52 "
+        ") VALUES %s "
+        "ON CONFLICT (datadate, gvkey) DO "
+        "UPDATE SET "
+        "       rtn_mean_4=EXCLUDED.rtn_mean_4, "
+        "       rtn_stdev_4=EXCLUDED.rtn_stdev_4, "
+        "       utilization_pct_mean_4=EXCLUDED.utilization_pct_mean_4, "
+        "       rtn_mean_12=EXCLUDED.rtn_mean_12, "
+        "       rtn_stdev_12=EXCLUDED.rtn_stdev_12, "
+        "       utilization_pct_mean_12=EXCLUDED.utilization_pct_mean_12, "
+        "       rtn_mean_52=EXCLUDED.rtn_mean_52, "
+        "       rtn_stdev_52=EXCLUDED.rtn_stdev_52, "
+        "       utilization_pct_mean_52=EXCLUDED.utilization_pct_mean_52; "
+    )
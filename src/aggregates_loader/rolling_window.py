@@ -0,0 +1,66 @@
+"""Sliding window accumulators for rolling features."""
+from collections import deque
+from decimal import Context, Decimal
+from typing import Deque, Optional, Tuple
+
+# Running sums context. Squares of the DECIMAL(25,15) base columns have up to
+# 50 digits, so sums of squares over any window fit without rounding.
+_SUMS = Context(prec=80)
+
+
+class RollingWindow:
+    """Accumulates the values of the last `size` periods.
+
+    Values are pushed with the index of the period they belong to, so missing
+    periods shrink the window instead of stretching it further back in time.
+    Running sums are accumulated without rounding in the _SUMS context, so
+    evicting a value exactly cancels adding it and results do not drift
+    with the number of pushes. Only mean and stdev are rounded.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._values: Deque[Tuple[int, Decimal]] = deque()
+        self._sum = Decimal(0)
+        self._sum_sq = Decimal(0)
+
+    def push(self, period: int, value: Optional[Decimal]) -> None:
+        """Adds the value of a period and evicts periods out of the window.
+
+        Args:
+            period: index of the period, must not decrease between pushes.
+            value: value for the period, None values are not accumulated.
+        """
+        while self._values and self._values[0][0] <= period - self.size:
+            _, old_value = self._values.popleft()
+            self._sum = _SUMS.subtract(self._sum, old_value)
+            self._sum_sq = _SUMS.subtract(
+                self._sum_sq, _SUMS.multiply(old_value, old_value)
+            )
+
+        if value is not None:
+            value = Decimal(value)
+            self._values.append((period, value))
+            self._sum = _SUMS.add(self._sum, value)
+            self._sum_sq = _SUMS.add(self._sum_sq, _SUMS.multiply(value, value))
+
+    def reset(self) -> None:
+        """Empties the window."""
+        self._values.clear()
+        self._sum = Decimal(0)
+        self._sum_sq = Decimal(0)
+
+    @property
+    def mean(self) -> Optional[Decimal]:
+        """Mean of the values in the window."""
+        n = len(self._values)
+        return self._sum / n if n else None
+
+    @property
+    def stdev(self) -> Optional[Decimal]:
+        """Sample standard deviation of the values in the window."""
+        n = len(self._values)
+        if n < 2:
+            return None
+        variance = (self._sum_sq - self._sum * self._sum / n) / (n - 1)
+        return max(variance, Decimal(0)).sqrt()
@@ -0,0 +1,46 @@
+"""Gvkey sharding."""
+from typing import NamedTuple, Optional, Tuple
+
+
+class Shard(NamedTuple):
+    """Subset of gvkeys with `gvkey % count == index`."""
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """Parses a shard from its `i/N` representation.
+
+        Args:
+            value: shard as `i/N`, with 0 <= i < N.
+
+        Returns:
+            Shard.
+        """
+        try:
+            index, count = (int(v) for v in value.split("/"))
+        except ValueError:
+            raise ValueError(f"Invalid shard {value!r}, expected i/N.")
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {value!r}, expected 0 <= i < N.")
+
+        return cls(index, count)
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def shard_filter(shard: Optional[Shard]) -> Tuple[str, Tuple]:
+    """Builds the SQL condition restricting a query to a shard.
+
+    Args:
+        shard: shard to restrict to, None for every gvkey.
+
+    Returns:
+        Condition to append to a WHERE clause and its parameters.
+    """
+    if shard is None:
+        return "", ()
+
+    return "AND gvkey %% %s = %s ", (shard.count, shard.index)
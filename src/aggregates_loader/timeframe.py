@@ -7,3 +7,5 @@ class TimeFrame(str, Enum):
 
     weekly = "weekly"
     monthly = "monthly"
+    quarterly = "quarterly"
+    annual = "annual"
@@ -0,0 +1,80 @@
+"""Cross-sectional winsorization of returns."""
+from datetime import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from aggregates_loader.persistence.source import Source
+
+logger = logging.getLogger(__name__)
+
+# Source of the current worker process, see init_worker.
+_source: Optional[Source] = None
+
+
+def winsorize_cross_section(returns: List[Tuple]) -> List[Tuple]:
+    """Clips the returns of a single date to its 5% and 95% quantiles.
+
+    Args:
+        returns: (datadate, gvkey, rtn) records of a single date.
+
+    Returns:
+        Winsorized (datadate, gvkey, rtn) records.
+    """
+    returns = sorted(returns, key=lambda r: r[2])
+    # CHANGE WINSORIZE FACTOR BELOW IF NEEDED
+    quantile_index = len(returns) // 20
+    high_value = returns[-quantile_index][2]
+    low_value = returns[quantile_index][2]
+
+    winsorized_returns = []
+    for r in returns:
+        if r[2] > high_value:
+            winsorized_returns.append((r[0], r[1], high_value))
+        elif r[2] < low_value:
+            winsorized_returns.append((r[0], r[1], low_value))
+        else:
+            winsorized_returns.append(r)
+
+    return winsorized_returns
+
+
+def winsorize_dates(
+    source: Source, timeframe: str, dates: List[datetime]
+) -> List[Tuple]:
+    """Fetches and winsorizes the returns of every given date.
+
+    Args:
+        source: source to fetch returns from.
+        timeframe: timeframe of the returns.
+        dates: dates to winsorize.
+
+    Returns:
+        Winsorized (datadate, gvkey, rtn) records.
+    """
+    raw_returns = source.get_returns(timeframe=timeframe, dates=dates)
+    if not raw_returns:
+        return []
+
+    history: Dict[datetime, List[Tuple]] = {}
+    for r in raw_returns:
+        if r[0] not in history.keys():
+            history[r[0]] = [r]
+        else:
+            history[r[0]].append(r)
+
+    winsorized_returns = []
+    for returns in history.values():
+        winsorized_returns.extend(winsorize_cross_section(returns))
+
+    return winsorized_returns
+
+
+def init_worker(connection_string: str) -> None:
+    """Opens the source connection of a worker process."""
+    global _source
+    _source = Source(connection_string)
+
+
+def winsorize_dates_worker(timeframe: str, dates: List[datetime]) -> List[Tuple]:
+    """winsorize_dates using the source of the worker process."""
+    return winsorize_dates(_source, timeframe, dates)